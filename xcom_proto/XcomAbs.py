@@ -4,50 +4,116 @@
 # Abstract base class used by various implementations of the Xcom protocol
 ##
 
+import time
 import logging
 
 from abc import ABC, abstractmethod
 
 from .parameters import *
 from .protocol import Package
+from .discovery import discoverDevices, DISCOVERY_CACHE_MAX_AGE
+from .dispatcher import Dispatcher, StaleRequestException, PRIORITY_CONTROL, PRIORITY_TELEMETRY
+from .ratecontrol import AdaptiveLimiter, getLimiter, isOverload
+from .subscription import SubscriptionManager, Subscription
 
 MSG_MAX_LENGTH = 256 # from Studer Xcom documentation
+RESPONSE_TIMEOUT = 2 # seconds, as recommended by Studer Xcom documentation
 
 class XcomAbs(ABC):
 
-    def __init__(self):
+    recorder = None
+
+    def __init__(self, limiterKey=None):
+        """
+        getValue(), getValues() and setValue() are safe to be called from
+        multiple threads, all requests of one instance are sent by its
+        dispatcher ordered by priority.
+
+        The pace of those requests is adapted to the gateway by the limiter,
+        which is shared between all instances using the same limiterKey.
+
+        sendPackage() itself is NOT thread safe and should not be called
+        directly while other threads use this instance, use sendRequest()
+        instead.
+        """
+
         self.log = logging.getLogger("XcomAbs")
+        self.limiter = getLimiter(limiterKey) if limiterKey else AdaptiveLimiter()
+        self.dispatcher = Dispatcher(f"XcomDispatcher-{id(self):x}", pacer=self.limiter)
+        self.subscriptions = SubscriptionManager(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback) -> bool:
+        self.close()
+        return False
 
-    def getValueByID(self, id: int, type: str, dstAddr=100, propertyID=QSP_UNSAVED_VALUE):
-        return self.getValue(Datapoint(id, "", type), dstAddr, propertyID)
+    def close(self):
+        """Stops the subscription and dispatcher threads of this instance"""
+        self.subscriptions.close()
+        self.dispatcher.close()
 
-    def getValue(self, parameter: Datapoint, dstAddr=100, propertyID=QSP_UNSAVED_VALUE):
+    def setRecorder(self, recorder):
+        """
+        recorder (e.g. capture.CaptureWriter) gets every raw request / response
+        frame pair sent by sendPackage(), pass None to stop recording
+        """
+        self.recorder = recorder
+
+    def getValueByID(self, id: int, type: str, dstAddr=100, propertyID=QSP_UNSAVED_VALUE, priority=PRIORITY_TELEMETRY):
+        return self.getValue(Datapoint(id, "", type), dstAddr, propertyID, priority)
+
+    def getValue(self, parameter: Datapoint, dstAddr=100, propertyID=QSP_UNSAVED_VALUE, priority=PRIORITY_TELEMETRY):
         self.log.debug(f"requesting value {parameter}")
 
-        objectType = TYPE_PARAMETER
+        request: Package = self.genReadPackage(parameter, dstAddr, propertyID)
+        response: Package = self.sendRequest(request, priority)
 
-        if 3000 <= parameter.id <= 3168:
-            objectType = TYPE_INFO
-        elif parameter.id >= 7000:
-            objectType = TYPE_INFO
-        
-        request: Package = Package.genPackage(
+        return parameter.unpackValue(response.frame_data.service_data.property_data)        
+
+    def getValues(self, requests: list[tuple[Datapoint, int]], propertyID=QSP_UNSAVED_VALUE,
+            priority=PRIORITY_TELEMETRY, window: int = None) -> list:
+        """
+        Reads all (parameter, dstAddr) pairs using pipelined requests,
+        returns the value or the raised exception for each pair.
+
+        Requests are sent in windows of the size the limiter allows, unless
+        window overrides it. Requests with a higher priority can be sent in
+        between two windows.
+        """
+        self.log.debug(f"requesting {len(requests)} values")
+
+        packages = [self.genReadPackage(parameter, dstAddr, propertyID) for parameter, dstAddr in requests]
+        responses = self._transmitBatch(packages, priority, window)
+
+        values = list()
+        for (parameter, _), response in zip(requests, responses):
+            if isinstance(response, Exception):
+                values.append(response)
+                continue
+            try:
+                values.append(parameter.unpackValue(response.frame_data.service_data.property_data))
+            except Exception as e:
+                values.append(e)
+
+        return values
+
+    @staticmethod
+    def genReadPackage(parameter: Datapoint, dstAddr=100, propertyID=QSP_UNSAVED_VALUE) -> Package:
+        return Package.genPackage(
             service_id=PROPERTY_READ,
             object_id=parameter.id,
-            object_type=objectType,
+            object_type=getObjectType(parameter.id),
             property_id=propertyID,
             property_data=b'',
             dst_addr=dstAddr
         )
 
-        response: Package = self.sendPackage(request)
-
-        return parameter.unpackValue(response.frame_data.service_data.property_data)        
+    def setValueByID(self, id: int, type: str, value, dstAddr=100, propertyID=QSP_UNSAVED_VALUE, priority=PRIORITY_CONTROL):
+        return self.setValue(Datapoint(id, "", type), value, dstAddr, propertyID, priority)
 
-    def setValueByID(self, id: int, type: str, value, dstAddr=100, propertyID=QSP_UNSAVED_VALUE):
-        return self.setValue(Datapoint(id, "", type), value, dstAddr, propertyID)
-
-    def setValue(self, parameter: Datapoint, value, dstAddr=100, propertyID=QSP_UNSAVED_VALUE):
+    def setValue(self, parameter: Datapoint, value, dstAddr=100, propertyID=QSP_UNSAVED_VALUE, priority=PRIORITY_CONTROL):
         self.log.debug(f"setting value {parameter}")
 
         request: Package = Package.genPackage(
@@ -59,13 +125,142 @@ class XcomAbs(ABC):
             dst_addr=dstAddr
         )
 
-        self.sendPackage(request)
+        self.sendRequest(request, priority)
+
+    def sendRequest(self, package: Package, priority=PRIORITY_TELEMETRY) -> Package:
+        """Thread safe sendPackage(), queued by the dispatcher and paced by the limiter"""
+        return self.dispatcher.run(lambda: self._transmit(package), priority)
 
     ## TODO
     #def setProperty():
     #    raise NotImplementedError
     
 
+    def subscribe(self, parameter: Datapoint, dstAddr=100, interval=5.0,
+            deadband=None, callback=None, maxSilence=None,
+            propertyID=QSP_UNSAVED_VALUE) -> Subscription:
+        """
+        Polls parameter every interval seconds and calls callback(subscription, value)
+        only if the value changed by more than deadband (absolute value or
+        subscription.Deadband), enum / bool values changed at all or
+        maxSilence seconds passed since the last delivered value.
+        """
+        return self.subscriptions.subscribe(parameter, dstAddr, interval,
+            deadband, callback, maxSilence, propertyID)
+
+    def discoverDevices(self, cacheFile: str = None, maxAge=DISCOVERY_CACHE_MAX_AGE, refresh=False) -> dict:
+        """
+        Probes all documented device addresses at once and returns a map of
+        dstAddr -> Device, see discovery.discoverDevices()
+        """
+        return discoverDevices(self, cacheFile, maxAge, refresh)
+
+    def sendPackages(self, packages: list[Package]) -> list:
+        """
+        Sends all packages and returns the response Package for each of them
+        in the same order, errors are returned instead of raised.
+
+        The default implementation sends them one by one, transports which
+        can pipeline requests override this.
+        """
+        responses = list()
+        for package in packages:
+            try:
+                responses.append(self.sendPackage(package))
+            except Exception as e:
+                responses.append(e)
+
+        return responses
+
+    def _transmit(self, package: Package) -> Package:
+        """sendPackage() on the dispatcher thread, the limiter learns from the outcome"""
+        start = time.monotonic()
+
+        try:
+            response = self.sendPackage(package)
+        except Exception as e:
+            if isOverload(e):
+                self.limiter.onOverload()
+            raise
+
+        self.limiter.onSuccess(time.monotonic() - start)
+        return response
+
+    def _transmitBatch(self, packages: list[Package], priority=PRIORITY_TELEMETRY, window: int = None) -> list:
+        """
+        Splits packages into windows and queues each of them as its own
+        dispatcher job, so that more urgent requests can be sent in between.
+        The deadline of every window is measured from the start of the batch.
+        """
+        responses = list()
+        started = time.monotonic()
+
+        while len(responses) < len(packages):
+            chunk = packages[len(responses):len(responses) + (window or self.limiter.getWindow())]
+
+            try:
+                responses.extend(self.dispatcher.run(lambda: self._transmitWindow(chunk), priority, started))
+            except StaleRequestException as e:
+                responses.extend([e] * len(chunk))
+
+        return responses
+
+    def _transmitWindow(self, packages: list[Package]) -> list:
+        """sendPackages() on the dispatcher thread, the limiter learns from the outcome"""
+        start = time.monotonic()
+
+        results = self.sendPackages(packages)
+
+        if any(isOverload(result) for result in results):
+            self.limiter.onOverload()
+        else:
+            self.limiter.onSuccess(time.monotonic() - start, len(packages))
+
+        return results
+
+    def _matchResponse(self, packages: list[Package], pending: dict, responses: list, raw: bytes) -> bool:
+        """
+        Assigns the raw response to the pending request it belongs to,
+        returns False if it does not belong to any of them
+        """
+        try:
+            retPackage = Package.parseBytes(raw)
+        except AssertionError as e:
+            self.log.debug(f"ignoring invalid package: {e}")
+            return False
+
+        self.log.debug(retPackage)
+
+        if not retPackage.isResponse():
+            return False
+
+        index = None
+        for i in pending:
+            if retPackage.answers(packages[i]):
+                if packages[i].header.dst_addr == retPackage.header.src_addr:
+                    index = i
+                    break
+                if index is None:
+                    index = i
+
+        if index is None:
+            self.log.debug("ignoring unrelated package")
+            return False
+
+        del pending[index]
+        self._record(packages[index].getBytes(), raw)
+
+        if err := retPackage.getError():
+            responses[index] = KeyError("Error received", err)
+        else:
+            responses[index] = retPackage
+
+        return True
+
+    def _record(self, request: bytes, response: bytes):
+        if self.recorder:
+            self.recorder.record(request, response)
+
     @abstractmethod
     def sendPackage(self, package: Package)  -> Package:
         raise NotImplementedError
\ No newline at end of file
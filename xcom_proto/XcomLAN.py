@@ -1,12 +1,13 @@
 #! /usr/bin/env python3
 
+import time
 import socket
 import logging
 
 from concurrent.futures import ThreadPoolExecutor
 
 from .protocol import Package
-from .XcomAbs import XcomAbs, MSG_MAX_LENGTH
+from .XcomAbs import XcomAbs, MSG_MAX_LENGTH, RESPONSE_TIMEOUT
 
 ##
 # Class abstracting Xcom-LAN TCP network protocol
@@ -22,6 +23,7 @@ class XcomLANTCP(XcomAbs):
         """
 
         self.localPort = port
+        super().__init__(("tcp", port))
         self.log = logging.getLogger("XcomLANTCP")
 
     def __enter__(self):
@@ -43,6 +45,7 @@ class XcomLANTCP(XcomAbs):
         return self
 
     def __exit__(self, error_type, error, traceback) -> bool:
+        self.close()
         self.conn.close()
         self.tcpServer.close()
 
@@ -54,9 +57,15 @@ class XcomLANTCP(XcomAbs):
         data: bytes = package.getBytes()
         
         self.log.debug(f" --> {data.hex()}")
-        self.conn.send(data)
 
-        response: bytes = self.conn.recv(MSG_MAX_LENGTH)
+        try:
+            self.conn.send(data)
+            response: bytes = self.conn.recv(MSG_MAX_LENGTH)
+        except Exception:
+            # unanswered requests are recorded with an empty response
+            self._record(data, b'')
+            raise
+
         self.log.debug(f" <-- {response.hex()}")
         
         retPackage = Package.parseBytes(response)
@@ -71,11 +80,49 @@ class XcomLANTCP(XcomAbs):
         except AssertionError:
             return self.sendPackage(package)
 
+        self._record(data, retPackage.getBytes())
+
         if err := retPackage.getError():
             raise KeyError("Error received", err)
 
         return retPackage
 
+    def sendPackages(self, packages: list[Package]) -> list:
+        responses = [TimeoutError("no response received")] * len(packages)
+        pending = dict(enumerate(packages))
+
+        for package in packages:
+            data: bytes = package.getBytes()
+            self.log.debug(f" --> {data.hex()}")
+            self.conn.send(data)
+
+        buffer = b''
+        # restarted by every matched reply, large windows only time out once the gateway stops answering
+        deadline = time.monotonic() + RESPONSE_TIMEOUT
+
+        try:
+            while pending and (remaining := deadline - time.monotonic()) > 0:
+                self.conn.settimeout(remaining)
+                try:
+                    response: bytes = self.conn.recv(MSG_MAX_LENGTH)
+                except socket.timeout:
+                    break
+                if not response:
+                    break
+                self.log.debug(f" <-- {response.hex()}")
+
+                raws, buffer = Package.splitStream(buffer + response)
+                for raw in raws:
+                    if self._matchResponse(packages, pending, responses, raw):
+                        deadline = time.monotonic() + RESPONSE_TIMEOUT
+        finally:
+            self.conn.settimeout(None)
+
+        for i in pending:
+            self._record(packages[i].getBytes(), b'')
+
+        return responses
+
 
 ##
 # Class abstracting Xcom-LAN UDP network protocol
@@ -97,6 +144,7 @@ class XcomLANUDP(XcomAbs):
 
         self.serverAddress = (serverIP, dstPort)
         self.clientPort = srcPort
+        super().__init__(("udp",) + self.serverAddress)
         self.log = logging.getLogger("XcomLAN")
 
         self.udpListener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -110,16 +158,24 @@ class XcomLANUDP(XcomAbs):
                 socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
             self.log.debug(f" --> {data.hex()}")
 
-            future = listener.submit(self._awaitUDPResponse, self.udpListener)
+            future = listener.submit(self._awaitUDPResponse, self.udpListener, package)
 
             sender.sendto(data, self.serverAddress)
 
-            value = future.result(10) 
+            try:
+                value = future.result(10)
+            except Exception:
+                # unanswered requests are recorded with an empty response
+                self._record(data, b'')
+                raise
             self.log.debug(f" <-- {value}")
 
         if not value:
+            self._record(data, b'')
             raise ValueError("Package listener returned None")
 
+        self._record(data, value)
+
         retPackage = Package.parseBytes(value)
         self.log.debug(retPackage)
 
@@ -128,11 +184,67 @@ class XcomLANUDP(XcomAbs):
         
         return retPackage
 
-    def _awaitUDPResponse(self, udpSocket: socket.socket) -> bytes:
+    def sendPackages(self, packages: list[Package]) -> list:
+        responses = [TimeoutError("no response received")] * len(packages)
+        pending = dict(enumerate(packages))
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+            for package in packages:
+                data: bytes = package.getBytes()
+                self.log.debug(f" --> {data.hex()}")
+                sender.sendto(data, self.serverAddress)
+
+        timeout = self.udpListener.gettimeout()
+        # restarted by every matched reply, large windows only time out once the gateway stops answering
+        deadline = time.monotonic() + RESPONSE_TIMEOUT
+
         try:
-            response = udpSocket.recv(MSG_MAX_LENGTH)
+            while pending and (remaining := deadline - time.monotonic()) > 0:
+                self.udpListener.settimeout(remaining)
+                try:
+                    value: bytes = self.udpListener.recv(MSG_MAX_LENGTH)
+                except socket.timeout:
+                    break
+                self.log.debug(f" <-- {value.hex()}")
+
+                if self._matchResponse(packages, pending, responses, value):
+                    deadline = time.monotonic() + RESPONSE_TIMEOUT
+        finally:
+            self.udpListener.settimeout(timeout)
+
+        for i in pending:
+            self._record(packages[i].getBytes(), b'')
+
+        return responses
+
+    def close(self):
+        super().close()
+        self.udpListener.close()
+
+    def _awaitUDPResponse(self, udpSocket: socket.socket, package: Package) -> bytes:
+        """
+        Returns the first response answering package, late responses to
+        earlier (e.g. timed out) requests are ignored
+        """
+        timeout = udpSocket.gettimeout()
+        deadline = time.monotonic() + RESPONSE_TIMEOUT
+
+        try:
+            while True:
+                udpSocket.settimeout(max(deadline - time.monotonic(), 0.001))
+                response = udpSocket.recv(MSG_MAX_LENGTH)
+
+                try:
+                    if Package.parseBytes(response).answers(package):
+                        return response
+                except AssertionError as e:
+                    self.log.debug(f"ignoring invalid package: {e}")
+                    continue
+
+                self.log.debug(f"ignoring unrelated package {response.hex()}")
+
         except socket.timeout:
             self.log.error("Waiting for response from XcomLAN timed out")
             raise
-
-        return response
+        finally:
+            udpSocket.settimeout(timeout)
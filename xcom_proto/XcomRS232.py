@@ -18,6 +18,7 @@ class XcomRS232(XcomAbs):
         self.serialDevice = serialDevice
         self.baudrate = baudrate
         self.timeout = timeout
+        super().__init__(("serial", serialDevice))
         self.log = logging.getLogger("XcomRS232")
 
     def sendPackage(self, package: Package) -> Package:
@@ -29,7 +30,13 @@ class XcomRS232(XcomAbs):
 
             response: bytes = ser.read_until(SERIAL_TERMINATOR, size=MSG_MAX_LENGTH)
             self.log.debug(f" <-- {response.hex()}")
-            assert len(response) > 0, "got empty response"
+
+        if not response:
+            # unanswered requests are recorded with an empty response
+            self._record(data[:-len(SERIAL_TERMINATOR)], b'')
+        assert len(response) > 0, "got empty response"
+
+        self._record(data[:-len(SERIAL_TERMINATOR)], response[:-len(SERIAL_TERMINATOR)])
 
         retPackage = Package.parseBytes(response[:-len(SERIAL_TERMINATOR)])
         self.log.debug(retPackage)
@@ -0,0 +1,304 @@
+#! /usr/bin/env python3
+
+##
+# Binary capture log of raw Xcom request / response frames
+#
+# File layout:  magic (4) | version (2) | record | record | ...
+# Record:       timestamp (f64) | request length (u16) | response length (u16)
+#               | request bytes | response bytes
+#
+# Requests without any response are recorded with an empty response.
+##
+
+import csv
+import mmap
+import os
+import struct
+import threading
+import time
+
+from typing import Iterator, TextIO
+
+from .parameters import *
+from .protocol import Package
+from .dispatcher import PRIORITY_BULK
+
+CAPTURE_MAGIC = b'XCAP'
+CAPTURE_VERSION = 1
+
+FILE_HEADER = struct.Struct("<4sH")
+RECORD_HEADER = struct.Struct("<dHH")
+
+# byte offsets inside a raw package (including start byte)
+OFFSET_DST_ADDR = 6
+OFFSET_SERVICE_FLAGS = 14
+OFFSET_SERVICE_ID = 15
+OFFSET_OBJECT_ID = 18
+OFFSET_PROPERTY_DATA = 24
+
+# error name of records without a response
+TIMEOUT_ERROR = "TIMEOUT"
+
+
+class CaptureWriter:
+
+    def __init__(self, path: str):
+        """
+        Appends raw frames to the capture file at path, a new file header is
+        only written if the file is empty.
+
+        Use with XcomAbs.setRecorder() to record every sendPackage() call.
+        """
+
+        self.path = path
+        self.lock = threading.Lock()
+
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback) -> bool:
+        self.close()
+        return False
+
+    def record(self, request: bytes, response: bytes, timestamp: float = None):
+        if timestamp is None:
+            timestamp = time.time()
+
+        data = RECORD_HEADER.pack(timestamp, len(request), len(response)) + request + response
+
+        with self.lock:
+            self.file.write(data)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class CaptureRecord:
+
+    timestamp: float
+    request: bytes
+    response: bytes
+
+    def __init__(self, timestamp: float, request: bytes, response: bytes):
+        self.timestamp = timestamp
+        self.request = request
+        self.response = response
+
+    @property
+    def dstAddr(self) -> int:
+        return readRawUInt(self.request, OFFSET_DST_ADDR)
+
+    @property
+    def objectId(self) -> int:
+        return readRawUInt(self.request, OFFSET_OBJECT_ID)
+
+    @property
+    def error(self) -> str:
+        return readRawError(self.response)
+
+    def requestPackage(self) -> Package:
+        return Package.parseBytes(self.request)
+
+    def responsePackage(self) -> Package:
+        return Package.parseBytes(self.response)
+
+    def value(self, parameter: Datapoint = None):
+        """Decodes the property data of a read response"""
+        if parameter is None:
+            parameter = Dataset.getParamByID(self.objectId)
+
+        response = self.responsePackage()
+        return parameter.unpackValue(response.frame_data.service_data.property_data)
+
+    def __str__(self) -> str:
+        return f"CaptureRecord(time={self.timestamp}, dst={self.dstAddr}, obj_id={self.objectId}, error={self.error})"
+
+
+class CaptureReader:
+
+    def __init__(self, path: str):
+        """
+        Memory maps the capture file at path, records are only copied out of
+        the map once they pass the filters of records().
+        """
+
+        self.path = path
+        self.file = open(path, "rb")
+
+        if os.fstat(self.file.fileno()).st_size < FILE_HEADER.size:
+            self.file.close()
+            raise AssertionError("empty or invalid capture file")
+
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = FILE_HEADER.unpack_from(self.map, 0)
+        assert magic == CAPTURE_MAGIC, "invalid capture file: magic not found"
+        assert version == CAPTURE_VERSION, f"unsupported capture version {version}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback) -> bool:
+        self.close()
+        return False
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __iter__(self) -> Iterator[CaptureRecord]:
+        return self.records()
+
+    def records(self, objectId: int = None, dstAddr: int = None, error=None) -> Iterator[CaptureRecord]:
+        """
+        Yields all records matching the given filters.
+
+        error can either be an error name like "DEVICE_NOT_FOUND" or "TIMEOUT"
+        (request without response), True for every error or False for
+        successful responses only.
+        """
+
+        data = self.map
+        size = len(data)
+        offset = FILE_HEADER.size
+
+        while offset + RECORD_HEADER.size <= size:
+            timestamp, reqLen, respLen = RECORD_HEADER.unpack_from(data, offset)
+            reqStart = offset + RECORD_HEADER.size
+            respStart = reqStart + reqLen
+            offset = respStart + respLen
+
+            if offset > size:
+                # truncated record at the end, writer did not finish
+                break
+
+            if objectId is not None and \
+                    readRawUInt(data, reqStart + OFFSET_OBJECT_ID, respStart) != objectId:
+                continue
+            if dstAddr is not None and \
+                    readRawUInt(data, reqStart + OFFSET_DST_ADDR, respStart) != dstAddr:
+                continue
+            if error is not None:
+                err = readRawError(data, respStart, offset)
+                if error is True and err is None:
+                    continue
+                if error is False and err is not None:
+                    continue
+                if isinstance(error, str) and err != error:
+                    continue
+
+            yield CaptureRecord(timestamp, data[reqStart:respStart], data[respStart:offset])
+
+    def values(self, parameter: Datapoint, dstAddr: int = None) -> Iterator[tuple]:
+        """Yields (timestamp, dstAddr, value) of all successful reads of parameter"""
+        for record, _, value in self._decodeReads({parameter.id: parameter}, dstAddr):
+            yield record.timestamp, record.dstAddr, value
+
+    def columns(self, parameters: list[Datapoint], dstAddr: int = None) -> dict[str, dict[str, list]]:
+        """
+        Decodes all successful reads of parameters into one column set per
+        parameter name: {"timestamp": [...], "dstAddr": [...], "value": [...]}
+        """
+
+        byID = {parameter.id: parameter for parameter in parameters}
+        result = {
+            parameter.name: {"timestamp": list(), "dstAddr": list(), "value": list()}
+            for parameter in parameters
+        }
+
+        for record, parameter, value in self._decodeReads(byID, dstAddr):
+            column = result[parameter.name]
+            column["timestamp"].append(record.timestamp)
+            column["dstAddr"].append(record.dstAddr)
+            column["value"].append(value)
+
+        return result
+
+    def exportCSV(self, f: TextIO, parameters: list[Datapoint], dstAddr: int = None):
+        """Streams all successful reads of parameters as CSV rows into f"""
+        byID = {parameter.id: parameter for parameter in parameters}
+
+        writer = csv.writer(f)
+        writer.writerow(("timestamp", "dstAddr", "name", "value"))
+
+        for record, parameter, value in self._decodeReads(byID, dstAddr):
+            writer.writerow((record.timestamp, record.dstAddr, parameter.name, value))
+
+    def _decodeReads(self, byID: dict[int, Datapoint], dstAddr: int = None) -> Iterator[tuple]:
+        """Yields (record, parameter, value) of all successful reads of the parameters in byID"""
+        # a single parameter is filtered on the raw bytes before copying the record
+        objectId = next(iter(byID)) if len(byID) == 1 else None
+
+        for record in self.records(objectId=objectId, dstAddr=dstAddr, error=False):
+            parameter = byID.get(record.objectId)
+            if parameter is None:
+                continue
+            if record.response[OFFSET_SERVICE_ID:OFFSET_SERVICE_ID+1] != PROPERTY_READ:
+                continue
+            try:
+                value = record.value(parameter)
+            except (AssertionError, struct.error):
+                continue
+            yield record, parameter, value
+
+    def replay(self, xcom, speed: float = None, **filters) -> Iterator[tuple]:
+        """
+        Sends all recorded requests to xcom (e.g. a simulator or proxy) and
+        yields (record, response) where response is either the returned
+        Package or the raised exception.
+
+        If speed is given, the recorded request timing is reproduced scaled by
+        that factor, otherwise requests are sent as fast as possible.
+        """
+
+        firstRecorded = None
+        started = time.monotonic()
+
+        for record in self.records(**filters):
+            if speed:
+                if firstRecorded is None:
+                    firstRecorded = record.timestamp
+                delay = (record.timestamp - firstRecorded) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+            try:
+                response = xcom.sendRequest(record.requestPackage(), PRIORITY_BULK)
+            except Exception as e:
+                response = e
+
+            yield record, response
+
+##
+
+def readRawUInt(data, offset: int, end: int = None) -> int:
+    if end is None:
+        end = len(data)
+    if offset + 4 > end:
+        return None
+    return struct.unpack_from("<I", data, offset)[0]
+
+def readRawError(data, start: int = 0, end: int = None) -> str:
+    """Reads the error name of a raw response without parsing the package"""
+    if end is None:
+        end = len(data)
+    if start >= end:
+        return TIMEOUT_ERROR
+    if start + OFFSET_SERVICE_FLAGS >= end:
+        return None
+    if not data[start + OFFSET_SERVICE_FLAGS] & 1:
+        return None
+    if start + OFFSET_PROPERTY_DATA + 2 > end:
+        return "UNKNOWN ERROR"
+
+    code = bytes(data[start + OFFSET_PROPERTY_DATA:start + OFFSET_PROPERTY_DATA + 2])
+    return ERROR_CODES.get(code, "UNKNOWN ERROR")
@@ -0,0 +1,150 @@
+#! /usr/bin/env python3
+
+##
+# Discovery of all devices connected to the Xcom gateway
+##
+
+import json
+import logging
+import time
+
+from dataclasses import dataclass, asdict
+
+from .parameters import *
+from .dispatcher import PRIORITY_BULK
+from .ratecontrol import OVERLOAD_ERRORS
+
+DISCOVERY_CACHE_MAX_AGE = 24 * 60 * 60 # seconds
+
+# first datapoint is used to probe the device, both hold the software version
+SOFT_VERSION_DATAPOINTS = {
+    DEVICE_XTENDER: (Dataset.XT_ID_SOFT_MSB, Dataset.XT_ID_SOFT_LSB),
+    DEVICE_VARIOTRACK: (Dataset.VT_ID_SOFT_MSB, Dataset.VT_ID_SOFT_LSB),
+    DEVICE_BSP: (Dataset.BSP_ID_SOFT_MSB, Dataset.BSP_ID_SOFT_LSB),
+    DEVICE_VARIOSTRING: (Dataset.VS_ID_SOFT_MSB, Dataset.VS_ID_SOFT_LSB),
+}
+
+log = logging.getLogger("XcomDiscovery")
+
+@dataclass
+class Device:
+    address: int
+    type: str
+    softVersion: str = None
+
+
+def discoverDevices(xcom, cacheFile: str = None, maxAge=DISCOVERY_CACHE_MAX_AGE, refresh=False) -> dict[int, Device]:
+    """
+    Returns a map of dstAddr -> Device of all devices answering on xcom.
+
+    If cacheFile is given, the result is loaded from there as long as it is
+    younger than maxAge seconds, otherwise all addresses are probed and the
+    cache is rewritten. Results with addresses that did not answer even
+    after a retry (gateway busy, timeouts) are not cached.
+    """
+
+    if cacheFile and not refresh:
+        devices = loadDeviceCache(cacheFile, maxAge)
+        if devices is not None:
+            log.debug(f"using {len(devices)} cached devices from {cacheFile}")
+            return devices
+
+    unanswered = list()
+    devices = probeDevices(xcom, unanswered)
+
+    if cacheFile:
+        if unanswered:
+            log.warning(f"not caching devices, no valid response from addresses {unanswered}")
+        else:
+            saveDeviceCache(cacheFile, devices)
+
+    return devices
+
+def probeDevices(xcom, unanswered: list = None) -> dict[int, Device]:
+    """
+    Probes all documented addresses with pipelined reads of the software
+    version, addresses without a valid response are appended to unanswered
+    """
+    probes = [
+        (deviceType, address)
+        for deviceType, addresses in DEVICE_ADDRESSES.items()
+        for address in addresses
+    ]
+
+    # all probes in one window, so that missing replies only cost one timeout
+    results = xcom.getValues([(SOFT_VERSION_DATAPOINTS[t][0], a) for t, a in probes],
+        priority=PRIORITY_BULK, window=len(probes))
+
+    retry = [i for i, result in enumerate(results) if isRetryError(result)]
+    if retry:
+        # the gateway was overloaded, so let the limiter pace the repetition
+        log.debug(f"repeating {len(retry)} probes")
+        retried = xcom.getValues([(SOFT_VERSION_DATAPOINTS[probes[i][0]][0], probes[i][1]) for i in retry], priority=PRIORITY_BULK)
+        for i, result in zip(retry, retried):
+            results[i] = result
+
+    devices = dict()
+    versionMSB = dict()
+
+    for (deviceType, address), result in zip(probes, results):
+        if isinstance(result, Exception):
+            error = getErrorName(result)
+            if error == "DEVICE_NOT_FOUND":
+                continue
+            if error is None or error in OVERLOAD_ERRORS:
+                log.warning(f"no valid response from address {address}: {result}")
+                if unanswered is not None:
+                    unanswered.append(address)
+                continue
+            # device is there, but does not know the software version info
+        else:
+            versionMSB[address] = result
+
+        devices[address] = Device(address, deviceType)
+
+    if versionMSB:
+        addresses = list(versionMSB.keys())
+        results = xcom.getValues([(SOFT_VERSION_DATAPOINTS[devices[a].type][1], a) for a in addresses],
+            priority=PRIORITY_BULK, window=len(addresses))
+
+        for address, result in zip(addresses, results):
+            if not isinstance(result, Exception):
+                devices[address].softVersion = formatSoftVersion(versionMSB[address], result)
+
+    log.info(f"discovered {len(devices)} devices")
+    return devices
+
+def formatSoftVersion(msb: float, lsb: float) -> str:
+    msb = int(msb)
+    lsb = int(lsb)
+    return f"{msb >> 8}.{lsb >> 8}.{lsb & 0xFF}"
+
+def isRetryError(result) -> bool:
+    if not isinstance(result, Exception):
+        return False
+    error = getErrorName(result)
+    return error is None or error in OVERLOAD_ERRORS
+
+##
+
+def loadDeviceCache(cacheFile: str, maxAge=DISCOVERY_CACHE_MAX_AGE) -> dict[int, Device]:
+    """Returns the cached devices or None if the cache is missing, invalid or too old"""
+    try:
+        with open(cacheFile, "r") as f:
+            cache = json.load(f)
+
+        if time.time() - cache["timestamp"] > maxAge:
+            return None
+
+        return {device["address"]: Device(**device) for device in cache["devices"]}
+
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        log.debug(f"ignoring device cache {cacheFile}: {e}")
+        return None
+
+def saveDeviceCache(cacheFile: str, devices: dict[int, Device]):
+    with open(cacheFile, "w") as f:
+        json.dump({
+            "timestamp": time.time(),
+            "devices": [asdict(device) for device in devices.values()]
+        }, f)
@@ -0,0 +1,184 @@
+#! /usr/bin/env python3
+
+##
+# Single worker thread per link executing requests ordered by priority
+##
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from concurrent.futures import Future
+
+### priorities, lower values are sent first
+PRIORITY_CONTROL    = 0
+PRIORITY_TELEMETRY  = 1
+PRIORITY_BULK       = 2
+
+# seconds a request may wait in the queue before it is dropped, None = never
+DEFAULT_DEADLINES = {
+    PRIORITY_CONTROL: None,
+    PRIORITY_TELEMETRY: 5.0,
+    PRIORITY_BULK: None,
+}
+
+
+class StaleRequestException(Exception):
+    pass
+
+
+class QueueStats:
+
+    def __init__(self):
+        self.depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.lastWait = 0.0
+        self.maxWait = 0.0
+        self.totalWait = 0.0
+
+    def addWait(self, wait: float):
+        self.lastWait = wait
+        self.maxWait = max(self.maxWait, wait)
+        self.totalWait += wait
+
+    @property
+    def avgWait(self) -> float:
+        done = self.sent + self.dropped
+        return self.totalWait / done if done else 0.0
+
+    def __str__(self) -> str:
+        return f"QueueStats(depth={self.depth}, sent={self.sent}, dropped={self.dropped}, avgWait={self.avgWait:.3f}, maxWait={self.maxWait:.3f})"
+
+
+class Dispatcher:
+
+    def __init__(self, name="XcomDispatcher", deadlines: dict = None, pacer=None):
+        """
+        All requests of one link are executed one after another by a single
+        worker thread, which is started with the first request.
+
+        Requests with a lower priority value jump ahead of queued requests
+        with a higher one, requests waiting longer than the deadline of
+        their priority fail with StaleRequestException instead of being sent.
+
+        pacer (e.g. ratecontrol.AdaptiveLimiter) is asked for the pause
+        before each request, requests queued during the pause are still
+        ordered by priority.
+        """
+
+        self.name = name
+        self.log = logging.getLogger(name)
+        self.pacer = pacer
+
+        self.deadlines = dict(DEFAULT_DEADLINES)
+        if deadlines:
+            self.deadlines.update(deadlines)
+
+        self.stats = {priority: QueueStats() for priority in self.deadlines}
+
+        self.queue = list()
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def setDeadline(self, priority: int, deadline: float):
+        with self.condition:
+            self.deadlines[priority] = deadline
+            self.stats.setdefault(priority, QueueStats())
+
+    def submit(self, function, priority=PRIORITY_TELEMETRY, since: float = None) -> Future:
+        """
+        Queues function, its deadline is measured from since (time.monotonic()
+        of the original request) or from now
+        """
+        future = Future()
+
+        with self.condition:
+            if not self.running:
+                self._start()
+
+            self.stats.setdefault(priority, QueueStats()).depth += 1
+            queued = time.monotonic() if since is None else since
+            heapq.heappush(self.queue, (priority, next(self.counter), queued, function, future))
+            self.condition.notify()
+
+        return future
+
+    def run(self, function, priority=PRIORITY_TELEMETRY, since: float = None):
+        """Executes function on the worker thread and waits for its result"""
+        if threading.current_thread() is self.thread:
+            # called from within a request, queueing would deadlock
+            return function()
+
+        return self.submit(function, priority, since).result()
+
+    def queueDepth(self, priority: int = None) -> int:
+        with self.condition:
+            if priority is None:
+                return len(self.queue)
+            return self.stats[priority].depth if priority in self.stats else 0
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+            while self.queue:
+                *_, future = heapq.heappop(self.queue)
+                future.set_exception(StaleRequestException("dispatcher closed"))
+            for stats in self.stats.values():
+                stats.depth = 0
+
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def _start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+        self.thread.start()
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.running:
+                    return
+
+                if self.pacer and (delay := self.pacer.delay()) > 0:
+                    # pick the request only after the pause, more urgent ones may arrive meanwhile
+                    self.condition.wait(delay)
+                    continue
+
+                priority, _, queued, function, future = heapq.heappop(self.queue)
+
+                stats = self.stats[priority]
+                stats.depth -= 1
+
+                wait = time.monotonic() - queued
+                stats.addWait(wait)
+
+                deadline = self.deadlines.get(priority)
+                if deadline is not None and wait > deadline:
+                    stats.dropped += 1
+                    self.log.debug(f"dropping request with priority {priority} after {wait:.3f}s")
+                    future.set_exception(StaleRequestException(f"request waited {wait:.3f}s"))
+                    continue
+
+                stats.sent += 1
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            if self.pacer:
+                self.pacer.acquire()
+
+            try:
+                future.set_result(function())
+            except Exception as e:
+                future.set_exception(e)
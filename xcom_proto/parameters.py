@@ -177,6 +177,50 @@ ERROR_CODES = {
     b'\x81\x00': "INVALID_SHELL_ARG",
 }
 
+def getErrorName(error: Exception) -> str:
+    """Returns the Xcom error name of errors raised by sendPackage()"""
+    if isinstance(error, KeyError) and len(error.args) == 2:
+        return error.args[1]
+    return None
+
+def getObjectType(id: int) -> bytes:
+    # VarioTrack (10xxx) and VarioString (14xxx) parameters are in between infos
+    if 10000 <= id < 11000 or 14000 <= id < 15000:
+        return TYPE_PARAMETER
+    if 3000 <= id <= 3168:
+        return TYPE_INFO
+    if id >= 7000:
+        return TYPE_INFO
+    return TYPE_PARAMETER
+
+### device types and their addresses
+DEVICE_XTENDER      = "XTENDER"
+DEVICE_VARIOTRACK   = "VARIOTRACK"
+DEVICE_BSP          = "BSP"
+DEVICE_VARIOSTRING  = "VARIOSTRING"
+
+DEVICE_ADDRESSES = {
+    DEVICE_XTENDER: range(101, 110),
+    DEVICE_VARIOTRACK: range(301, 316),
+    DEVICE_BSP: range(601, 602),
+    DEVICE_VARIOSTRING: range(701, 716),
+}
+
+DEVICE_MULTICAST_ADDRESSES = {
+    DEVICE_XTENDER: 100,
+    DEVICE_VARIOTRACK: 300,
+    DEVICE_BSP: 600,
+    DEVICE_VARIOSTRING: 700,
+}
+
+# parameter ids of each device type
+DEVICE_PARAMETER_IDS = {
+    DEVICE_XTENDER: range(1000, 2000),
+    DEVICE_BSP: range(6000, 7000),
+    DEVICE_VARIOTRACK: range(10000, 11000),
+    DEVICE_VARIOSTRING: range(14000, 15000),
+}
+
 ### main parameters
 
 class Dataset:
@@ -207,6 +251,8 @@ class Dataset:
     AC_CURRENT_IN = Datapoint(3012, "AC_CURRENT_IN", TYPE_FLOAT, "A")
     AC_CURRENT_OUT = Datapoint(3022, "AC_CURRENT_OUT", TYPE_FLOAT, "A")
     BATT_CYCLE_PHASE_XT = Datapoint(3010, "BATT_CYCLE_PHASE_XT", TYPE_SHORT_ENUM)
+    XT_ID_SOFT_MSB = Datapoint(3130, "XT_ID_SOFT_MSB", TYPE_FLOAT)
+    XT_ID_SOFT_LSB = Datapoint(3131, "XT_ID_SOFT_LSB", TYPE_FLOAT)
 
     # Xcom-CAN BMS parameters (Writable)
     SOC_LEVEL_FOR_BACKUP = Datapoint(6062, "SOC_LEVEL_FOR_BACKUP", TYPE_FLOAT)
@@ -223,6 +269,8 @@ class Dataset:
     BATT_DISCHARGE = Datapoint(7008, "BATT_DISCHARGE", TYPE_FLOAT, "Ah")
     BATT_CHARGE_PREV_DAY = Datapoint(7009, "BATT_CHARGE_PREV_DAY", TYPE_FLOAT, "Ah")
     BATT_DISCHARGE_PREV_DAY = Datapoint(7010, "BATT_DISCHARGE_PREV_DAY", TYPE_FLOAT, "Ah")
+    BSP_ID_SOFT_MSB = Datapoint(7037, "BSP_ID_SOFT_MSB", TYPE_FLOAT)
+    BSP_ID_SOFT_LSB = Datapoint(7038, "BSP_ID_SOFT_LSB", TYPE_FLOAT)
 
     # VarioTrack infos (Read only)
     PV_VOLTAGE = Datapoint(11041 ,"PV_VOLTAGE", TYPE_FLOAT, "V")
@@ -235,6 +283,8 @@ class Dataset:
 
     PV_OPERATION_MODE = Datapoint(11016, "PV_OPERATION_MODE", TYPE_SHORT_ENUM)
     PV_NEXT_EQUAL = Datapoint(11037, "PV_NEXT_EQUAL", TYPE_FLOAT, "d")
+    VT_ID_SOFT_MSB = Datapoint(11050, "VT_ID_SOFT_MSB", TYPE_FLOAT)
+    VT_ID_SOFT_LSB = Datapoint(11051, "VT_ID_SOFT_LSB", TYPE_FLOAT)
 
     # VarioTrack parameters (Writable)
     FORCE_NEW_CYCLE = Datapoint(10029, "FORCE_NEW_CYCLE", TYPE_SINT)
@@ -243,6 +293,8 @@ class Dataset:
     VS_PV_POWER = Datapoint(15010, "VS_PV_POWER", TYPE_FLOAT, "kW")
     VS_PV_PROD = Datapoint(15017, "VS_PV_PROD", TYPE_FLOAT, "kWh")
     VS_PV_ENERGY_PREV_DAY = Datapoint(15027, "VS_PV_ENERGY_PREV_DAY", TYPE_FLOAT, "kWh")
+    VS_ID_SOFT_MSB = Datapoint(15077, "VS_ID_SOFT_MSB", TYPE_FLOAT)
+    VS_ID_SOFT_LSB = Datapoint(15078, "VS_ID_SOFT_LSB", TYPE_FLOAT)
 
     @staticmethod
     def getParamByID(id: int) -> Datapoint:
@@ -211,6 +211,37 @@ class Package:
         self.assemble(buf)
         return buf.getvalue()
 
+    @staticmethod
+    def splitStream(buf: bytes) -> tuple[list[bytes], bytes]:
+        """Splits buf into complete raw packages and the unfinished remainder"""
+        packages = list()
+
+        while (start := buf.find(Package.start_byte)) >= 0:
+            buf = buf[start:]
+            if len(buf) < 1 + Header.length + 2:
+                return packages, buf
+
+            if checksum(buf[1:1 + Header.length]) != buf[1 + Header.length:3 + Header.length]:
+                # start byte inside of unrelated data
+                buf = buf[1:]
+                continue
+
+            length = 1 + Header.length + 2 + int.from_bytes(buf[10:12], byteorder="little") + 2
+            if len(buf) < length:
+                return packages, buf
+
+            packages.append(buf[:length])
+            buf = buf[length:]
+
+        return packages, b''
+
+    def answers(self, request) -> bool:
+        """Checks if this is the response to request"""
+        return self.isResponse() \
+            and self.frame_data.service_id == request.frame_data.service_id \
+            and self.frame_data.service_data.object_id == request.frame_data.service_data.object_id \
+            and self.frame_data.service_data.property_id == request.frame_data.service_data.property_id
+
     def isResponse(self) -> bool:
         return (self.frame_data.service_flags & 2) >> 1 == 1
 
@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+
+##
+# Adaptive in-flight window and request rate per transport / gateway
+##
+
+import socket
+import logging
+import threading
+import time
+
+from .parameters import getErrorName
+
+# errors the gateway uses to signal that it is overloaded
+OVERLOAD_ERRORS = ("SCOM_ERROR_GATEWAY_BUSY", "RESPONSE_TIMEOUT")
+
+
+class AdaptiveLimiter:
+
+    def __init__(self, name="XcomLimiter",
+            initialWindow=4, minWindow=1, maxWindow=32,
+            maxInterval=2.0, latencyTolerance=2.0, backoff=0.5):
+        """
+        Additive increase / multiplicative decrease of the number of
+        pipelined requests (window) and the pause between requests (interval).
+
+        Clean replies halve the pause, and while the latency per request
+        stays below latencyTolerance times the lowest recent latency the
+        window grows by one request per window of clean replies. Busy or
+        timeout errors shrink the window by backoff and double the pause,
+        up to maxInterval seconds.
+        """
+
+        self.log = logging.getLogger(name)
+        self.lock = threading.Lock()
+
+        self.minWindow = minWindow
+        self.maxWindow = maxWindow
+        self.maxInterval = maxInterval
+        self.latencyTolerance = latencyTolerance
+        self.backoff = backoff
+
+        self.window = float(initialWindow)
+        self.interval = 0.0
+        self.baseLatency = None
+        self.latency = None
+        self.lastSend = 0.0
+
+        self.overloads = 0
+
+    def getWindow(self) -> int:
+        with self.lock:
+            return max(self.minWindow, int(self.window))
+
+    def delay(self) -> float:
+        """Seconds until the current interval since the last request has passed"""
+        with self.lock:
+            return max(0.0, self.lastSend + self.interval - time.monotonic())
+
+    def acquire(self):
+        """Waits until the current interval since the last request has passed"""
+        with self.lock:
+            now = time.monotonic()
+            sendAt = max(now, self.lastSend + self.interval)
+            self.lastSend = sendAt
+
+        if sendAt > now:
+            time.sleep(sendAt - now)
+
+    def onSuccess(self, latency: float, count=1):
+        """count requests were answered cleanly after latency seconds"""
+        latency = latency / max(count, 1)
+
+        with self.lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = 0.8 * self.latency + 0.2 * latency
+
+            if self.baseLatency is None or latency < self.baseLatency:
+                self.baseLatency = latency
+            else:
+                # slowly follow latency changes which are here to stay
+                self.baseLatency += (latency - self.baseLatency) * 0.01
+
+            self.interval = self.interval / 2 if self.interval > 0.001 else 0.0
+
+            if self.latency > self.baseLatency * self.latencyTolerance:
+                # gateway is getting slower, do not grow the window further
+                return
+
+            self.window = min(self.maxWindow, self.window + count / self.window)
+
+    def onOverload(self):
+        with self.lock:
+            self.overloads += 1
+            self.window = max(self.minWindow, self.window * self.backoff)
+            self.interval = min(self.maxInterval, max(self.interval * 2, 0.05))
+            self.log.debug(f"gateway overloaded, window={self.window:.1f} interval={self.interval:.3f}s")
+
+    def __str__(self) -> str:
+        return f"AdaptiveLimiter(window={self.window:.1f}, interval={self.interval:.3f}, latency={self.latency}, overloads={self.overloads})"
+
+##
+
+limiters = dict()
+limitersLock = threading.Lock()
+
+def getLimiter(key) -> AdaptiveLimiter:
+    """Returns the limiter shared by all transports talking to the gateway key"""
+    with limitersLock:
+        if key not in limiters:
+            limiters[key] = AdaptiveLimiter(f"XcomLimiter-{key}")
+        return limiters[key]
+
+def isOverload(error: Exception) -> bool:
+    if isinstance(error, (TimeoutError, socket.timeout)):
+        return True
+    return getErrorName(error) in OVERLOAD_ERRORS
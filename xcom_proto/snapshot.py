@@ -0,0 +1,302 @@
+#! /usr/bin/env python3
+
+##
+# Snapshot of all device parameters and diff between snapshots
+##
+
+import sys
+import json
+import time
+import logging
+import argparse
+
+from dataclasses import dataclass, field, asdict, fields
+
+from .parameters import *
+from .dispatcher import PRIORITY_BULK
+from .discovery import Device
+
+QSP_LEVEL_NAMES = {
+    QSP_LEVEL_VIEW_ONLY: "VIEW_ONLY",
+    QSP_LEVEL_BASIC: "BASIC",
+    QSP_LEVEL_EXPERT: "EXPERT",
+    QSP_LEVEL_INSTALLER: "INSTALLER",
+    QSP_LEVEL_QSP: "QSP",
+}
+
+# not accessible over SCOM
+EXCLUDED_PARAMETERS = (Dataset.USER_LEVEL,)
+
+log = logging.getLogger("XcomSnapshot")
+
+@dataclass
+class SnapshotItem:
+    address: int
+    id: int
+    name: str
+    value: object = None
+    unsavedValue: object = None
+    min: object = None
+    max: object = None
+    level: str = None
+    error: str = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.address}/{self.id}"
+
+    @property
+    def unsaved(self) -> bool:
+        """Value in RAM differs from the one in flash"""
+        return self.value is not None and self.unsavedValue is not None \
+            and self.value != self.unsavedValue
+
+@dataclass
+class SnapshotDiff:
+    old: SnapshotItem
+    new: SnapshotItem
+    changes: dict # field -> (old, new)
+
+    @property
+    def unsaved(self) -> bool:
+        return any(item is not None and item.unsaved for item in (self.old, self.new))
+
+    def __str__(self) -> str:
+        item = self.new or self.old
+        marker = "*" if self.unsaved else " "
+        changes = ", ".join(f"{k}: {old} -> {new}" for k, (old, new) in self.changes.items())
+        return f"{marker} {item.address:>4} {item.id:>5} {item.name}: {changes}"
+
+@dataclass
+class Snapshot:
+    timestamp: float
+    devices: dict[int, Device] = field(default_factory=dict)
+    items: dict[str, SnapshotItem] = field(default_factory=dict)
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({
+                "timestamp": self.timestamp,
+                "devices": [asdict(device) for device in self.devices.values()],
+                "items": [astuple(item) for item in self.items.values()],
+            }, f, separators=(",", ":"), default=jsonDefault)
+
+    @staticmethod
+    def load(path: str):
+        with open(path, "r") as f:
+            data = json.load(f)
+
+        snapshot = Snapshot(data["timestamp"])
+        for device in data["devices"]:
+            snapshot.devices[device["address"]] = Device(**device)
+        for row in data["items"]:
+            item = SnapshotItem(*row)
+            snapshot.items[item.key] = item
+
+        return snapshot
+
+
+class MetadataCache:
+
+    def __init__(self, path: str = None):
+        """
+        QSP_MIN, QSP_MAX and QSP_LEVEL of a parameter only depend on the
+        device type and its firmware, so they are kept in path and only
+        read from devices with unknown firmware.
+        """
+
+        self.path = path
+        self.entries = dict()
+
+        if path:
+            try:
+                with open(path, "r") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                log.debug(f"ignoring metadata cache {path}: {e}")
+
+    @staticmethod
+    def getKey(device: Device, parameter: Datapoint) -> str:
+        if not device.softVersion:
+            return None
+        return f"{device.type}/{device.softVersion}/{parameter.id}"
+
+    def get(self, device: Device, parameter: Datapoint) -> list:
+        key = self.getKey(device, parameter)
+        metadata = self.entries.get(key) if key else None
+
+        # incomplete entries were written after failed reads, read them again
+        if metadata is None or None in metadata:
+            return None
+        return metadata
+
+    def set(self, device: Device, parameter: Datapoint, metadata: list):
+        """Only complete metadata is kept, failed reads are repeated next time"""
+        if None in metadata:
+            return
+        if key := self.getKey(device, parameter):
+            self.entries[key] = metadata
+
+    def save(self):
+        if self.path:
+            with open(self.path, "w") as f:
+                json.dump(self.entries, f, separators=(",", ":"), default=jsonDefault)
+
+
+def getDeviceParameters(deviceType: str) -> list[Datapoint]:
+    """All known writable parameters of deviceType"""
+    ids = DEVICE_PARAMETER_IDS.get(deviceType, range(0))
+    return [
+        point for point in Dataset._getDatapoints()
+        if point.id in ids
+            and getObjectType(point.id) == TYPE_PARAMETER
+            and point not in EXCLUDED_PARAMETERS
+    ]
+
+def takeSnapshot(xcom, devices: dict[int, Device] = None, parameters: list[Datapoint] = None,
+        metadataCache: str = None) -> Snapshot:
+    """
+    Reads QSP_VALUE, QSP_UNSAVED_VALUE, QSP_MIN, QSP_MAX and QSP_LEVEL of all
+    parameters of the given devices (all discovered ones by default) using
+    pipelined requests. parameters overrides the parameters read from each
+    device, which default to all known parameters of its type. Only the
+    parameters belonging to the type of a device are read from it.
+    """
+
+    if devices is None:
+        devices = xcom.discoverDevices()
+
+    metadata = MetadataCache(metadataCache)
+    snapshot = Snapshot(time.time(), dict(devices))
+
+    reads = list()
+    for device in devices.values():
+        if parameters:
+            ids = DEVICE_PARAMETER_IDS.get(device.type, range(0))
+            deviceParameters = [parameter for parameter in parameters if parameter.id in ids]
+        else:
+            deviceParameters = getDeviceParameters(device.type)
+
+        for parameter in deviceParameters:
+            reads.append((device, parameter))
+
+    readSnapshot(xcom, snapshot, reads, metadata)
+    return snapshot
+
+def readSnapshot(xcom, snapshot: Snapshot, reads: list[tuple[Device, Datapoint]], metadata: MetadataCache):
+    reads = [
+        (device, parameter, SnapshotItem(device.address, parameter.id, parameter.name))
+        for device, parameter in reads
+    ]
+    for _, _, item in reads:
+        snapshot.items[item.key] = item
+
+    readValues(xcom, reads, "value", QSP_VALUE)
+    readValues(xcom, reads, "unsavedValue", QSP_UNSAVED_VALUE)
+
+    missing = list()
+    for device, parameter, item in reads:
+        if item.error:
+            continue
+        if cached := metadata.get(device, parameter):
+            item.min, item.max, item.level = cached
+        else:
+            missing.append((device, parameter, item))
+
+    if missing:
+        log.debug(f"reading metadata of {len(missing)} parameters")
+
+        readValues(xcom, missing, "min", QSP_MIN, keepErrors=False)
+        readValues(xcom, missing, "max", QSP_MAX, keepErrors=False)
+        readValues(xcom, missing, "level", QSP_LEVEL, keepErrors=False)
+
+        for device, parameter, item in missing:
+            metadata.set(device, parameter, [item.min, item.max, item.level])
+        metadata.save()
+
+def readValues(xcom, reads: list[tuple], name: str, propertyID: bytes, keepErrors=True):
+    if propertyID == QSP_LEVEL:
+        requests = [(Datapoint(p.id, p.name, TYPE_BYTES), d.address) for d, p, _ in reads]
+    else:
+        requests = [(p, d.address) for d, p, _ in reads]
+
+    values = xcom.getValues(requests, propertyID, priority=PRIORITY_BULK)
+
+    for (_, _, item), value in zip(reads, values):
+        if isinstance(value, Exception):
+            if keepErrors and not item.error:
+                item.error = getErrorName(value) or str(value)
+            continue
+
+        if propertyID == QSP_LEVEL:
+            value = QSP_LEVEL_NAMES.get(value, value.hex())
+        setattr(item, name, value)
+
+def diffSnapshots(old: Snapshot, new: Snapshot) -> list[SnapshotDiff]:
+    """Returns all items which are different or only exist in one of the snapshots"""
+    diffs = list()
+
+    for key in list(old.items.keys()) + [k for k in new.items.keys() if k not in old.items]:
+        oldItem = old.items.get(key)
+        newItem = new.items.get(key)
+
+        if oldItem is None or newItem is None:
+            diffs.append(SnapshotDiff(oldItem, newItem, {"item": (
+                "missing" if oldItem is None else "present",
+                "missing" if newItem is None else "present"
+            )}))
+            continue
+
+        changes = dict()
+        for f in ("value", "unsavedValue", "min", "max", "level", "error"):
+            a = getattr(oldItem, f)
+            b = getattr(newItem, f)
+            if a != b:
+                changes[f] = (a, b)
+
+        if changes:
+            diffs.append(SnapshotDiff(oldItem, newItem, changes))
+
+    return diffs
+
+def diffLive(xcom, snapshot: Snapshot, metadataCache: str = None) -> list[SnapshotDiff]:
+    """Compares snapshot with the current values of the same items"""
+    live = Snapshot(time.time(), dict(snapshot.devices))
+
+    reads = list()
+    for item in snapshot.items.values():
+        try:
+            parameter = Dataset.getParamByID(item.id)
+        except UnknownDatapointException:
+            log.warning(f"skipping unknown parameter {item.id}")
+            continue
+        device = snapshot.devices.get(item.address, Device(item.address, None))
+        reads.append((device, parameter))
+
+    readSnapshot(xcom, live, reads, MetadataCache(metadataCache))
+    return diffSnapshots(snapshot, live)
+
+##
+
+def astuple(item: SnapshotItem) -> list:
+    return [getattr(item, f.name) for f in fields(item)]
+
+def jsonDefault(value):
+    if isinstance(value, bytes):
+        return value.hex()
+    raise TypeError(f"cannot serialize {type(value)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two Xcom parameter snapshots, unsaved items are marked with *")
+    parser.add_argument("old", help="snapshot file")
+    parser.add_argument("new", help="snapshot file")
+    args = parser.parse_args()
+
+    diffs = diffSnapshots(Snapshot.load(args.old), Snapshot.load(args.new))
+    for diff in diffs:
+        print(diff)
+
+    return 1 if diffs else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
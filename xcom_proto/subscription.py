@@ -0,0 +1,210 @@
+#! /usr/bin/env python3
+
+##
+# Change driven subscriptions polling the bus in the background
+##
+
+import logging
+import threading
+import time
+
+from dataclasses import dataclass
+
+from .parameters import *
+from .dispatcher import PRIORITY_TELEMETRY
+
+# types which are compared with a deadband, all others are delivered on change
+NUMERIC_TYPES = (TYPE_FLOAT, TYPE_SINT)
+
+
+@dataclass
+class Deadband:
+    absolute: float = None
+    percent: float = None
+
+    def exceeded(self, last, value) -> bool:
+        """Checks if value moved far enough from the last delivered value"""
+        delta = abs(value - last)
+
+        if delta == 0:
+            # otherwise a last value of 0 exceeds every percent deadband
+            return False
+
+        if self.absolute is not None and delta >= self.absolute:
+            return True
+        if self.percent is not None and delta >= abs(last) * self.percent / 100:
+            return True
+
+        return self.absolute is None and self.percent is None
+
+
+class Subscription:
+
+    def __init__(self, manager, parameter: Datapoint, dstAddr: int, interval: float,
+            deadband: Deadband = None, callback=None, maxSilence: float = None,
+            propertyID=QSP_UNSAVED_VALUE):
+
+        if deadband is not None and not isinstance(deadband, Deadband):
+            deadband = Deadband(absolute=deadband)
+
+        self.manager = manager
+        self.parameter = parameter
+        self.dstAddr = dstAddr
+        self.interval = interval
+        self.deadband = deadband
+        self.callback = callback
+        self.maxSilence = maxSilence
+        self.propertyID = propertyID
+
+        self.value = None
+        self.delivered = None
+
+    @property
+    def key(self) -> tuple:
+        return self.parameter.id, self.dstAddr, self.propertyID
+
+    def cancel(self):
+        self.manager.unsubscribe(self)
+
+    def offer(self, value, now: float) -> bool:
+        """Delivers value to the callback if it is worth it"""
+        if not self.shouldDeliver(value, now):
+            return False
+
+        self.value = value
+        self.delivered = now
+
+        if self.callback:
+            self.callback(self, value)
+        return True
+
+    def shouldDeliver(self, value, now: float) -> bool:
+        if self.delivered is None:
+            return True
+        if self.maxSilence is not None and now - self.delivered >= self.maxSilence:
+            return True
+
+        if self.parameter.type in NUMERIC_TYPES and self.deadband is not None:
+            return self.deadband.exceeded(self.value, value)
+
+        return value != self.value
+
+    def __str__(self) -> str:
+        return f"Subscription({self.parameter.name or self.parameter.id}, dst={self.dstAddr}, interval={self.interval})"
+
+
+class SubscriptionManager:
+
+    def __init__(self, xcom, name="XcomSubscriptions"):
+        """
+        Polls all subscribed datapoints of xcom on a background thread.
+
+        Subscriptions to the same datapoint, dstAddr and propertyID share one
+        read, which happens at the shortest interval of them. All reads due
+        at the same time are sent as one pipelined getValues() request.
+        """
+
+        self.xcom = xcom
+        self.name = name
+        self.log = logging.getLogger(name)
+
+        self.subscriptions = dict() # key -> list of subscriptions
+        self.nextPoll = dict() # key -> time of next read
+
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def subscribe(self, parameter: Datapoint, dstAddr=100, interval=5.0,
+            deadband=None, callback=None, maxSilence=None,
+            propertyID=QSP_UNSAVED_VALUE) -> Subscription:
+
+        subscription = Subscription(self, parameter, dstAddr, interval,
+            deadband, callback, maxSilence, propertyID)
+
+        with self.condition:
+            key = subscription.key
+            self.subscriptions.setdefault(key, list()).append(subscription)
+            self.nextPoll[key] = time.monotonic()
+
+            if not self.running:
+                self._start()
+            self.condition.notify()
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.condition:
+            key = subscription.key
+            subscriptions = self.subscriptions.get(key, list())
+
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(key, None)
+                self.nextPoll.pop(key, None)
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def _start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._worker, name=self.name, daemon=True)
+        self.thread.start()
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                while self.running:
+                    now = time.monotonic()
+                    due = [key for key, nextPoll in self.nextPoll.items() if nextPoll <= now]
+                    if due:
+                        break
+
+                    timeout = min(self.nextPoll.values()) - now if self.nextPoll else None
+                    self.condition.wait(timeout)
+
+                if not self.running:
+                    return
+
+                requests = list()
+                for key in due:
+                    subscriptions = self.subscriptions[key]
+                    self.nextPoll[key] = now + min(s.interval for s in subscriptions)
+                    requests.append((subscriptions[0].parameter, key[1], key[2]))
+
+            self._poll(requests)
+
+    def _poll(self, requests: list[tuple]):
+        byProperty = dict()
+        for parameter, dstAddr, propertyID in requests:
+            byProperty.setdefault(propertyID, list()).append((parameter, dstAddr))
+
+        for propertyID, reads in byProperty.items():
+            try:
+                values = self.xcom.getValues(reads, propertyID, priority=PRIORITY_TELEMETRY)
+            except Exception as e:
+                self.log.warning(f"reading {len(reads)} subscribed values failed: {e}")
+                continue
+
+            now = time.monotonic()
+
+            for (parameter, dstAddr), value in zip(reads, values):
+                if isinstance(value, Exception):
+                    self.log.warning(f"reading {parameter.name or parameter.id} from {dstAddr} failed: {value}")
+                    continue
+
+                with self.condition:
+                    subscriptions = list(self.subscriptions.get((parameter.id, dstAddr, propertyID), list()))
+
+                for subscription in subscriptions:
+                    try:
+                        subscription.offer(value, now)
+                    except Exception:
+                        self.log.exception(f"callback of {subscription} failed")